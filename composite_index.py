@@ -0,0 +1,168 @@
+"""
+This script builds a composite competitiveness index from several statewide races for every district.
+
+There is 1 input for each year, race and district type:
+- The {year}_{race}_by_{district_type}.csv rollup from sos_precinct_level_results.py (or a plan rollup from plan_data)
+
+The vote shares of every race are kept in a cache, one CSV file per district type with a district row and
+a democrat/republican share column pair per (year, race). Only the races that are missing from the cache, or whose
+rollup is newer than the cache, are read again, so adding a year or a race does not rebuild the whole cache.
+
+The composite margin is the weighted average of the Democrat minus Republican share of each race, and each district
+is put in a competitiveness band by its composite margin.
+
+The output is placed in composite_data directory.
+"""
+
+import csv
+import os
+
+from sos_precinct_level_results import statewide_races_by_year, district_types
+from swing_simulation import load_district_rollup
+
+# Absolute composite margin upper limits for each band, checked in order. Positive margins are Democratic.
+competitiveness_bands = (
+    (0.05, 'Competitive'),
+    (0.10, 'Lean'),
+    (0.15, 'Likely'),
+    (1.00, 'Safe'),
+)
+
+
+def rollup_file(year, race, district_type):
+    # Same locations as sos_precinct_level_results.write_csv_files
+    if district_type in district_types:
+        return f"./election_data/{year}/{year}_{race}_by_{district_type}.csv"
+    return f"./plan_data/{year}_{race}_by_{district_type}.csv"
+
+
+def cache_file(district_type):
+    return f"./composite_data/{district_type}_vote_shares.csv"
+
+
+def load_cache(district_type):
+    """
+    Read the vote share cache of a district type, or start an empty one
+    {
+    'district_type': 'co_house',
+    'mtime': ...,  # when the cache file was written, 0 if there is no cache file yet
+    'districts': [1, 2, ...],
+    'shares': {
+        (2020, 'us_president'): {1: (dem_share, rep_share), 2: ...},
+        ...
+        },
+    }
+    """
+    cache = dict(district_type=district_type, mtime=0, districts=[], shares=dict())
+    csvin = cache_file(district_type)
+    if not os.path.exists(csvin):
+        return cache
+    cache['mtime'] = os.path.getmtime(csvin)
+    with open(csvin, 'r') as fp1:
+        csvreader = csv.DictReader(fp1)
+        columns = [column[:-len('_democrat')] for column in csvreader.fieldnames if column.endswith('_democrat')]
+        for column in columns:
+            year, race = column.split('_', 1)
+            cache['shares'][(int(year), race)] = dict()
+        for row in csvreader:
+            district = int(row['district'])
+            cache['districts'].append(district)
+            for column in columns:
+                year, race = column.split('_', 1)
+                cache['shares'][(int(year), race)][district] = (float(row[f"{column}_democrat"]), float(row[f"{column}_republican"]))
+    return cache
+
+
+def update_cache(cache, races):
+    """
+    Add the (year, race) vote shares that are missing from the cache or whose rollup changed since the cache was written
+    Returns the list of (year, race) that were read
+    """
+    updated = []
+    for year, race in races:
+        csvin = rollup_file(year, race, cache['district_type'])
+        if (year, race) in cache['shares'] and os.path.getmtime(csvin) <= cache['mtime']:
+            continue
+        print(f"Processing {csvin}")
+        districts = load_district_rollup(csvin)
+        district_numbers = [district['district'] for district in districts]
+        if not cache['districts']:
+            cache['districts'] = district_numbers
+        elif sorted(district_numbers) != sorted(cache['districts']):
+            raise Exception(f"Districts in {csvin} do not match the other races of {cache['district_type']}")
+        cache['shares'][(year, race)] = {district['district']: (district['dem_share'], district['rep_share']) for district in districts}
+        updated.append((year, race))
+    return updated
+
+
+def save_cache(cache):
+    csvout = cache_file(cache['district_type'])
+    os.makedirs(os.path.dirname(csvout), exist_ok=True)
+    columns = sorted(cache['shares'].keys())
+    header = ['district']
+    for year, race in columns:
+        header += [f"{year}_{race}_democrat", f"{year}_{race}_republican"]
+    with open(csvout, 'w') as fp2:
+        csvwriter = csv.writer(fp2)
+        csvwriter.writerow(header)
+        for district in cache['districts']:
+            row = [district]
+            for column in columns:
+                row += list(cache['shares'][column][district])
+            csvwriter.writerow(row)
+    cache['mtime'] = os.path.getmtime(csvout)
+
+
+def competitiveness_band(composite_margin):
+    for limit, band in competitiveness_bands:
+        if abs(composite_margin) <= limit:
+            if band == 'Competitive':
+                return band
+            party = 'D' if composite_margin > 0 else 'R'
+            return f"{band} {party}"
+    raise Exception(f"Composite margin out of range: {composite_margin}")
+
+
+def composite_index(cache, weights):
+    """
+    Weighted composite margin and competitiveness band of every district
+    weights is a dict {(year, race): weight}, the weights do not have to add up to 1
+    """
+    total_weight = sum(weights.values())
+    if total_weight <= 0:
+        raise Exception("Composite weights must add up to more than 0")
+    rows = []
+    for district in cache['districts']:
+        composite_margin = 0.0
+        for column, weight in weights.items():
+            dem_share, rep_share = cache['shares'][column][district]
+            composite_margin += (dem_share - rep_share) * weight
+        composite_margin /= total_weight
+        rows.append(dict(district=district, composite_margin=composite_margin, band=competitiveness_band(composite_margin)))
+    return rows
+
+
+def write_csv_file(district_type, rows):
+    csvout = f"./composite_data/{district_type}_composite.csv"
+    print(f"Writing {csvout}")
+    header = ('district', 'composite_margin', 'band')
+    with open(csvout, 'w') as fp2:
+        csvwriter = csv.DictWriter(fp2, fieldnames=header)
+        csvwriter.writeheader()
+        csvwriter.writerows(rows)
+
+
+if __name__ == "__main__":
+    # Statewide races in the composite and their weights, every race from 2016 to 2020 counts the same
+    weights = {(year, race): 1.0 for year in (2016, 2018, 2020) for race in statewide_races_by_year[year].keys()}
+
+    # Proposed plans with rollups in plan_data can be added here, see district_assignment.py
+    plans = []
+
+    for district_type in list(district_types.keys()) + plans:
+        cache = load_cache(district_type)
+        updated = update_cache(cache, weights.keys())
+        if updated:
+            save_cache(cache)
+            print(f"Updated {len(updated)} races in {cache_file(district_type)}")
+        write_csv_file(district_type, composite_index(cache, weights))
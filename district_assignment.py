@@ -0,0 +1,238 @@
+"""
+This script assigns precincts to the districts of a proposed map and rolls up the statewide races by those districts.
+
+Proposed maps arrive as district polygons, not as precinct numbers. There are 2 inputs for each map:
+- A GeoJSON file of precinct points (or precinct centroids) with the 10 digit SOS precinct number as a property
+- A GeoJSON file of district polygons with the district number as a property
+
+The polygons are put in a grid spatial index and every precinct point is tested against the polygons that overlap
+its grid cell. The precinct to district assignment is then fed into the precinct level results rollup.
+
+The output is placed in plan_data directory.
+"""
+
+import locale
+import csv
+import json
+import math
+import os
+import time
+
+from sos_precinct_level_results import process_precinct_level_results
+
+
+def load_precinct_points(geojson_file, precinct_property='precinct'):
+    """
+    Read the precinct points from a GeoJSON FeatureCollection of Point features
+    Returns a list of (precinct_number, x, y) tuples
+    """
+    with open(geojson_file, 'r') as fp1:
+        feature_collection = json.load(fp1)
+    points = []
+    for feature in feature_collection['features']:
+        geometry = feature['geometry']
+        if geometry['type'] != 'Point':
+            raise Exception(f"Expected a Point for precinct {feature['properties'].get(precinct_property)}, got {geometry['type']}")
+        x, y = geometry['coordinates'][:2]
+        points.append((str(feature['properties'][precinct_property]), float(x), float(y)))
+    return points
+
+
+def load_district_polygons(geojson_file, district_property='district'):
+    """
+    Read the district polygons from a GeoJSON FeatureCollection of Polygon or MultiPolygon features
+    Returns a list of dicts, one per feature:
+    {'district': 1, 'rings': [[(x, y), ...], ...], 'bbox': (min_x, min_y, max_x, max_y)}
+    All rings (outer rings and holes of every part) are kept together because the even-odd rule handles them the same way.
+    """
+    with open(geojson_file, 'r') as fp1:
+        feature_collection = json.load(fp1)
+    polygons = []
+    for feature in feature_collection['features']:
+        geometry = feature['geometry']
+        district = int(feature['properties'][district_property])
+        if geometry['type'] == 'Polygon':
+            parts = [geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            parts = geometry['coordinates']
+        else:
+            raise Exception(f"Expected a Polygon or MultiPolygon for district {district}, got {geometry['type']}")
+        rings = []
+        for part in parts:
+            for ring in part:
+                ring = [(float(x), float(y)) for x, y in (coordinates[:2] for coordinates in ring)]
+                # GeoJSON rings should be closed, but be forgiving
+                if ring[0] != ring[-1]:
+                    ring.append(ring[0])
+                rings.append(ring)
+        xs = [x for ring in rings for x, _ in ring]
+        ys = [y for ring in rings for _, y in ring]
+        polygons.append(dict(district=district, rings=rings, bbox=(min(xs), min(ys), max(xs), max(ys))))
+    return polygons
+
+
+def index_polygon_edges(polygon, edges_per_band=4):
+    """
+    Bucket the polygon edges into horizontal bands so a point only has to look at the edges crossing its own band
+    Horizontal edges are dropped because they never cross the ray cast from a point
+    """
+    min_x, min_y, max_x, max_y = polygon['bbox']
+    edge_count = sum(len(ring) - 1 for ring in polygon['rings'])
+    band_count = max(1, min(1024, edge_count // edges_per_band))
+    band_height = (max_y - min_y) / band_count or 1.0
+    bands = [[] for _ in range(band_count)]
+    for ring in polygon['rings']:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+            if y1 == y2:
+                continue
+            low_band = min(int((min(y1, y2) - min_y) / band_height), band_count - 1)
+            high_band = min(int((max(y1, y2) - min_y) / band_height), band_count - 1)
+            for band in range(low_band, high_band + 1):
+                bands[band].append((x1, y1, x2, y2))
+    polygon['band_count'] = band_count
+    polygon['band_height'] = band_height
+    polygon['bands'] = bands
+
+
+def point_in_polygon(x, y, polygon):
+    """
+    Even-odd ray casting against the edges in the band of the point
+    Points exactly on a shared boundary may land in either district
+    """
+    min_x, min_y, max_x, max_y = polygon['bbox']
+    if x < min_x or x > max_x or y < min_y or y > max_y:
+        return False
+    band = min(int((y - min_y) / polygon['band_height']), polygon['band_count'] - 1)
+    inside = False
+    for x1, y1, x2, y2 in polygon['bands'][band]:
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def build_spatial_index(polygons, cells_per_side=None):
+    """
+    Build a grid spatial index over the district polygons
+    {
+    'bbox': (min_x, min_y, max_x, max_y),
+    'cells_per_side': 32,
+    'cell_width': ...,
+    'cell_height': ...,
+    'cells': {(0, 0): [polygon, ...], ...},
+    }
+    Each cell lists the polygons whose bounding box overlaps it, in file order
+    """
+    if not polygons:
+        raise Exception("No district polygons to index!")
+    if cells_per_side is None:
+        # About 16 cells per district keeps the candidate lists short without a huge grid
+        cells_per_side = max(1, int(math.sqrt(len(polygons))) * 4)
+    min_x = min(polygon['bbox'][0] for polygon in polygons)
+    min_y = min(polygon['bbox'][1] for polygon in polygons)
+    max_x = max(polygon['bbox'][2] for polygon in polygons)
+    max_y = max(polygon['bbox'][3] for polygon in polygons)
+    index = {
+        'bbox': (min_x, min_y, max_x, max_y),
+        'cells_per_side': cells_per_side,
+        'cell_width': (max_x - min_x) / cells_per_side or 1.0,
+        'cell_height': (max_y - min_y) / cells_per_side or 1.0,
+        'cells': dict(),
+    }
+    for polygon in polygons:
+        index_polygon_edges(polygon)
+        low_cell = grid_cell(index, polygon['bbox'][0], polygon['bbox'][1])
+        high_cell = grid_cell(index, polygon['bbox'][2], polygon['bbox'][3])
+        for column in range(low_cell[0], high_cell[0] + 1):
+            for row in range(low_cell[1], high_cell[1] + 1):
+                index['cells'].setdefault((column, row), []).append(polygon)
+    return index
+
+
+def grid_cell(index, x, y):
+    """
+    Returns the (column, row) grid cell of a point, or None if the point is outside the indexed area
+    """
+    min_x, min_y, max_x, max_y = index['bbox']
+    if x < min_x or x > max_x or y < min_y or y > max_y:
+        return None
+    last_cell = index['cells_per_side'] - 1
+    return (min(int((x - min_x) / index['cell_width']), last_cell), min(int((y - min_y) / index['cell_height']), last_cell))
+
+
+def assign_precincts(points, index):
+    """
+    Assign every precinct point to a district
+    Points are batched by grid cell so each batch is only tested against the polygons overlapping that cell
+    Returns the assignment {precinct_number: district} and the list of precinct numbers outside every district
+    """
+    assignment = dict()
+    unassigned = []
+    batches = dict()
+    seen = set()
+    for precinct_number, x, y in points:
+        if precinct_number in seen:
+            raise Exception(f"Duplicate precinct number {precinct_number}!")
+        seen.add(precinct_number)
+        cell = grid_cell(index, x, y)
+        if cell is None:
+            unassigned.append(precinct_number)
+        else:
+            batches.setdefault(cell, []).append((precinct_number, x, y))
+    for cell, batch in batches.items():
+        candidates = index['cells'].get(cell, [])
+        for precinct_number, x, y in batch:
+            for polygon in candidates:
+                if point_in_polygon(x, y, polygon):
+                    assignment[precinct_number] = polygon['district']
+                    break
+            else:
+                unassigned.append(precinct_number)
+    return assignment, unassigned
+
+
+def write_assignment_csv(assignment, csvout):
+    header = ('precinct', 'district')
+    with open(csvout, 'w') as fp2:
+        csvwriter = csv.writer(fp2)
+        csvwriter.writerow(header)
+        for precinct_number in sorted(assignment.keys()):
+            csvwriter.writerow((precinct_number, assignment[precinct_number]))
+
+
+if __name__ == "__main__":
+    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')  # For parsing numbers with comma separators
+
+    # Precinct points must come from the same year as the precinct level results because precinct numbers change
+    years = {
+        2020: {'csvin': '2020GEPrecinctLevelResultsPosted.csv', 'geojson_precincts': 'precincts.2020.geojson'},
+    }
+    # Proposed maps, one GeoJSON file of district polygons each
+    plans = {
+        'us_house_prelim': {'geojson_districts': 'us_house_prelim.geojson'},
+        'co_senate_prelim': {'geojson_districts': 'co_senate_prelim.geojson'},
+        'co_house_prelim': {'geojson_districts': 'co_house_prelim.geojson'},
+    }
+
+    os.makedirs('./plan_data', exist_ok=True)
+    for year in years.keys():
+        geojson_precincts = "./plan_files/{geojson_precincts}".format(geojson_precincts=years[year]['geojson_precincts'])
+        print(f"Processing {geojson_precincts}")
+        points = load_precinct_points(geojson_precincts)
+        assignments = dict()
+        for plan_name in plans.keys():
+            geojson_districts = "./plan_files/{geojson_districts}".format(geojson_districts=plans[plan_name]['geojson_districts'])
+            print(f"Processing {geojson_districts}")
+            start = time.perf_counter()
+            index = build_spatial_index(load_district_polygons(geojson_districts))
+            assignment, unassigned = assign_precincts(points, index)
+            print(f"Assigned {len(assignment)} precincts to {plan_name} in {time.perf_counter() - start:.3f} seconds")
+            if unassigned:
+                raise Exception(f"{len(unassigned)} precincts are outside every district in {plan_name}: {unassigned[:10]}")
+            csvout = f"./plan_data/{plan_name}.{year}.csv"
+            write_assignment_csv(assignment, csvout)
+            print(f"CSV written to {csvout}")
+            assignments[plan_name] = assignment
+
+        csvin = "./sos_files/{csvin}".format(csvin=years[year]['csvin'])
+        print(f"Processing {csvin}...")
+        process_precinct_level_results(year, csvin, plans=assignments)
@@ -0,0 +1,264 @@
+"""
+This script is an editing engine for redrawing maps one precinct (or a handful of precincts) at a time.
+
+There are 2 inputs for each year:
+- The General Election Precinct Level results
+- The General Election Precinct Level Turnout results
+
+Moving precincts from one district to another only subtracts their votes and voters from the old district
+and adds them to the new one, then updates the winner and landslide flags of those 2 districts, so a move costs
+the same no matter how many precincts there are. Registered voters stand in for population in the balance numbers.
+Every move can be undone and redone, and the precincts that moved can be exported to a diff CSV.
+
+The output is placed in plan_data directory.
+"""
+
+import locale
+import csv
+import os
+
+from sos_precinct_level_results import load_precinct_votes, precinct_number_matcher
+from swing_simulation import landslide_percentage
+
+
+def load_precinct_turnout(csvin_precinct, year):
+    """
+    Read the registered voters and ballots cast of each precinct
+    Returns {precinct_number: {'total_voters': 0, 'ballots_cast': 0}}
+    """
+    turnout = dict()
+    with open(csvin_precinct, 'r') as fp1:
+        csvreader = csv.DictReader(fp1)
+        for row in csvreader:
+            # Make sure the precinct number is valid
+            precinct_number_matcher(row['Precinct'], year, row['County'])
+            turnout[row['Precinct']] = dict(total_voters=locale.atoi(row['Total Voters']), ballots_cast=locale.atoi(row['Ballots Cast']))
+    return turnout
+
+
+def init_district():
+    return dict(votes=dict(), counties=dict(), total_voters=0, ballots_cast=0, winners=dict(), landslides=dict())
+
+
+def init_session(precincts, turnout, district_type, assignment=None):
+    """
+    Start an editing session from the precincts of load_precinct_votes and the turnout of load_precinct_turnout
+    The starting map is the district_type of each precinct, or a plan assignment {precinct_number: district}
+    {
+    'district_type': 'co_house',
+    'races': ['us_president', 'us_senator'],
+    'precincts': {...},
+    'original': {precinct_number: district},
+    'assignment': {precinct_number: district},
+    'districts': {
+        1: {
+            'votes': {'us_president': {'democrat': 0, 'republican': 0, 'other': 0}, ...},
+            'counties': {'ADAMS': 12, ...},  # precincts per county
+            'total_voters': 0,
+            'ballots_cast': 0,
+            'winners': {'us_president': 'democrat', ...},
+            'landslides': {'us_president': 0, ...},
+            },
+        ...
+        },
+    'ideal_voters': ...,  # registered voters per district if every district was the same size
+    'undo': [],
+    'redo': [],
+    }
+    """
+    races = list(next(iter(precincts.values()))['votes'].keys())
+    session = dict(district_type=district_type, races=races, precincts=precincts, original=dict(), assignment=dict(),
+                   districts=dict(), undo=[], redo=[])
+    for precinct_number, precinct in precincts.items():
+        if assignment is None:
+            district = precinct['districts'][district_type]
+        elif precinct_number in assignment:
+            district = assignment[precinct_number]
+        else:
+            # Provisional precincts cannot be placed in a plan
+            continue
+        # Provisional precincts have no turnout row
+        precinct['total_voters'] = turnout.get(precinct_number, {}).get('total_voters', 0)
+        precinct['ballots_cast'] = turnout.get(precinct_number, {}).get('ballots_cast', 0)
+        if district not in session['districts']:
+            session['districts'][district] = init_district()
+            for race in races:
+                session['districts'][district]['votes'][race] = dict(democrat=0, republican=0, other=0)
+        session['original'][precinct_number] = district
+        session['assignment'][precinct_number] = district
+        add_precinct(session['districts'][district], precinct)
+    for district in session['districts'].values():
+        update_district_status(district)
+    session['ideal_voters'] = sum(district['total_voters'] for district in session['districts'].values()) / len(session['districts'])
+    return session
+
+
+def add_precinct(district, precinct, sign=1):
+    for race, votes in precinct['votes'].items():
+        district_votes = district['votes'][race]
+        for party, count in votes.items():
+            district_votes[party] += sign * count
+    district['total_voters'] += sign * precinct['total_voters']
+    district['ballots_cast'] += sign * precinct['ballots_cast']
+    county = precinct['county']
+    district['counties'][county] = district['counties'].get(county, 0) + sign
+    if district['counties'][county] == 0:
+        del district['counties'][county]
+
+
+def remove_precinct(district, precinct):
+    add_precinct(district, precinct, sign=-1)
+
+
+def update_district_status(district):
+    """
+    Winner and landslide flag of each race, same rules as the election summaries
+    A district without votes, a tie or a race won by another party has no winner
+    """
+    for race, votes in district['votes'].items():
+        total = votes['democrat'] + votes['republican'] + votes['other']
+        if votes['democrat'] > votes['republican'] and votes['democrat'] > votes['other']:
+            winner = 'democrat'
+        elif votes['republican'] > votes['democrat'] and votes['republican'] > votes['other']:
+            winner = 'republican'
+        else:
+            winner = None
+        district['winners'][race] = winner
+        district['landslides'][race] = int(winner is not None and votes[winner] / total >= landslide_percentage)
+
+
+def apply_moves(session, moves):
+    """
+    Apply a list of (precinct_number, from_district, to_district) moves
+    """
+    for precinct_number, from_district, to_district in moves:
+        precinct = session['precincts'][precinct_number]
+        remove_precinct(session['districts'][from_district], precinct)
+        add_precinct(session['districts'][to_district], precinct)
+        session['assignment'][precinct_number] = to_district
+    changed_districts = {from_district for _, from_district, _ in moves} | {to_district for _, _, to_district in moves}
+    for district in changed_districts:
+        update_district_status(session['districts'][district])
+
+
+def move_precincts(session, precinct_numbers, to_district):
+    """
+    Move precincts to another district, the precincts may come from different districts
+    Returns the list of (precinct_number, from_district, to_district) moves, precincts already in to_district are skipped
+    """
+    if to_district not in session['districts']:
+        raise Exception(f"Invalid district {to_district} for {session['district_type']}")
+    moves = []
+    for precinct_number in dict.fromkeys(precinct_numbers):  # Drop repeated precincts, keep the order
+        if precinct_number not in session['assignment']:
+            raise Exception(f"Unable to move precinct {precinct_number}, it is not in the map!")
+        from_district = session['assignment'][precinct_number]
+        if from_district != to_district:
+            moves.append((precinct_number, from_district, to_district))
+    if moves:
+        apply_moves(session, moves)
+        session['undo'].append(moves)
+        session['redo'] = []
+    return moves
+
+
+def undo(session):
+    if not session['undo']:
+        return []
+    moves = session['undo'].pop()
+    apply_moves(session, [(precinct_number, to_district, from_district) for precinct_number, from_district, to_district in reversed(moves)])
+    session['redo'].append(moves)
+    return moves
+
+
+def redo(session):
+    if not session['redo']:
+        return []
+    moves = session['redo'].pop()
+    apply_moves(session, moves)
+    session['undo'].append(moves)
+    return moves
+
+
+def district_summary(session, district_number, race):
+    """
+    Current totals of a district for a race, in the same format as the election summaries plus the balance numbers
+    """
+    district = session['districts'][district_number]
+    votes = district['votes'][race]
+    return {
+        'district': district_number,
+        'counties': ' - '.join(sorted(county.title() for county in district['counties'].keys())),
+        'registered_voters': district['total_voters'],
+        'ballots_cast': district['ballots_cast'],
+        'democrat': votes['democrat'],
+        'republican': votes['republican'],
+        'other': votes['other'],
+        'total': votes['democrat'] + votes['republican'] + votes['other'],
+        'dem_winner': int(district['winners'][race] == 'democrat'),
+        'rep_winner': int(district['winners'][race] == 'republican'),
+        'landslide_d': int(district['winners'][race] == 'democrat' and district['landslides'][race] == 1),
+        'landslide_r': int(district['winners'][race] == 'republican' and district['landslides'][race] == 1),
+        'turnout': round(district['ballots_cast'] / district['total_voters'], 4) if district['total_voters'] else 0,
+        'voter_deviation': round(district['total_voters'] / session['ideal_voters'] - 1, 4),
+    }
+
+
+def write_diff_csv(session, csvout):
+    """
+    Write the precincts that are in a different district than when the session started
+    """
+    header = ('precinct', 'county', 'from_district', 'to_district')
+    with open(csvout, 'w') as fp2:
+        csvwriter = csv.writer(fp2)
+        csvwriter.writerow(header)
+        for precinct_number in sorted(session['assignment'].keys()):
+            if session['assignment'][precinct_number] != session['original'][precinct_number]:
+                csvwriter.writerow((precinct_number, session['precincts'][precinct_number]['county'],
+                                    session['original'][precinct_number], session['assignment'][precinct_number]))
+
+
+def write_districts_csv(session, race, csvout):
+    with open(csvout, 'w') as fp2:
+        csvwriter = None
+        for district_number in sorted(session['districts'].keys()):
+            csvout_row = district_summary(session, district_number, race)
+            if csvwriter is None:
+                csvwriter = csv.DictWriter(fp2, fieldnames=csvout_row.keys())
+                csvwriter.writeheader()
+            csvwriter.writerow(csvout_row)
+
+
+if __name__ == "__main__":
+    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')  # For parsing numbers with comma separators
+
+    # Example session: move precincts between 2 state house districts, look at the totals, then undo and redo
+    year = 2020
+    csvin = "./sos_files/2020GEPrecinctLevelResultsPosted.csv"
+    csvin_precinct = "./sos_files/2020GEPrecinctLevelTurnoutPosted.csv"
+    district_type = 'co_house'
+    race = 'us_president'
+    edits = [
+        (['4253001245'], 31),
+    ]
+
+    print(f"Processing {csvin}")
+    precincts = load_precinct_votes(year, csvin)
+    print(f"Processing {csvin_precinct}")
+    turnout = load_precinct_turnout(csvin_precinct, year)
+    session = init_session(precincts, turnout, district_type)
+    for precinct_numbers, to_district in edits:
+        for precinct_number, from_district, to_district in move_precincts(session, precinct_numbers, to_district):
+            print(f"Moved {precinct_number} from district {from_district} to {to_district}")
+            for district_number in (from_district, to_district):
+                print(district_summary(session, district_number, race))
+    undo(session)
+    redo(session)
+
+    os.makedirs('./plan_data', exist_ok=True)
+    csvout = f"./plan_data/{district_type}_moves.{year}.csv"
+    write_diff_csv(session, csvout)
+    print(f"CSV written to {csvout}")
+    csvout = f"./plan_data/{year}_{race}_by_{district_type}_moves.csv"
+    write_districts_csv(session, race, csvout)
+    print(f"CSV written to {csvout}")
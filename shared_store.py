@@ -0,0 +1,208 @@
+"""
+This script publishes the precinct votes and district rollups once into shared memory so that analysis worker
+processes can attach to them without each loading and copying their own.
+
+There are 2 inputs for each year:
+- The General Election Precinct Level results (see sos_precinct_level_results.py)
+- The {year}_{race}_by_{district_type}.csv rollups in election_data directory
+
+The shared memory block starts with the length of a JSON header, followed by the header and the arrays of 64 bit
+integers it describes:
+- precinct_votes_{year}: [precinct][race][party] votes, party is democrat, republican, other
+- precinct_districts_{year}: [precinct][district_type] district numbers
+- rollup_{year}_{race}_{district_type}: [district][party] votes
+Workers get read-only memoryviews straight into the shared block, nothing but the header is copied.
+
+The publishing process owns the block and has to unlink it when the workers are done.
+"""
+
+import locale
+import json
+import multiprocessing
+import struct
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from sos_precinct_level_results import statewide_races_by_year, district_types, load_precinct_votes
+from swing_simulation import load_district_rollup
+
+parties = ('democrat', 'republican', 'other')
+header_length_format = '<Q'
+alignment = 8
+
+
+def aligned(offset):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def build_arrays(precincts_by_year):
+    """
+    Flatten the precinct votes of load_precinct_votes and the election_data rollups into arrays of 64 bit integers
+    Returns the header (without offsets) and the dict of arrays {name: array('q')}
+    """
+    header = dict(parties=list(parties), district_types=list(district_types.keys()), arrays=dict(),
+                  precincts=dict(), counties=dict(), races=dict(), rollup_districts=dict())
+    arrays = dict()
+    for year in statewide_races_by_year.keys():
+        races = list(statewide_races_by_year[year].keys())
+        header['races'][str(year)] = races
+        if year in precincts_by_year:
+            precincts = precincts_by_year[year]
+            precinct_numbers = list(precincts.keys())
+            header['precincts'][str(year)] = precinct_numbers
+            header['counties'][str(year)] = [precincts[precinct_number]['county'] for precinct_number in precinct_numbers]
+            votes = array('q')
+            districts = array('q')
+            for precinct_number in precinct_numbers:
+                precinct = precincts[precinct_number]
+                for race in races:
+                    votes.extend(precinct['votes'][race][party] for party in parties)
+                districts.extend(precinct['districts'][district_type] for district_type in district_types.keys())
+            arrays[f"precinct_votes_{year}"] = (votes, [len(precinct_numbers), len(races), len(parties)])
+            arrays[f"precinct_districts_{year}"] = (districts, [len(precinct_numbers), len(district_types)])
+        for race in races:
+            for district_type in district_types.keys():
+                rollup = load_district_rollup(f"./election_data/{year}/{year}_{race}_by_{district_type}.csv")
+                name = f"rollup_{year}_{race}_{district_type}"
+                header['rollup_districts'][name] = [district['district'] for district in rollup]
+                votes = array('q')
+                for district in rollup:
+                    votes.extend(district[party] for party in parties)
+                arrays[name] = (votes, [len(rollup), len(parties)])
+    return header, arrays
+
+
+def publish_store(name, precincts_by_year):
+    """
+    Create the shared memory block and copy the arrays in
+    Returns the SharedMemory, keep it open while the workers run then close() and unlink() it
+    """
+    header, arrays = build_arrays(precincts_by_year)
+    offset = 0
+    for array_name, (values, shape) in arrays.items():
+        header['arrays'][array_name] = dict(offset=offset, shape=shape)
+        offset = aligned(offset + len(values) * values.itemsize)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = aligned(struct.calcsize(header_length_format) + len(header_bytes))
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=data_start + max(offset, alignment))
+    struct.pack_into(header_length_format, shm.buf, 0, len(header_bytes))
+    shm.buf[struct.calcsize(header_length_format):struct.calcsize(header_length_format) + len(header_bytes)] = header_bytes
+    for array_name, (values, shape) in arrays.items():
+        start = data_start + header['arrays'][array_name]['offset']
+        shm.buf[start:start + len(values) * values.itemsize] = values.tobytes()
+    return shm
+
+
+def attach_store(name):
+    """
+    Attach to a published block, only the header is read
+    {
+    'shm': SharedMemory,
+    'header': {...},
+    'data_start': ...,
+    'views': [],  # memoryviews handed out, released by close_store
+    }
+    """
+    try:
+        # Python 3.13+, otherwise the resource tracker of a worker may unlink the block when the worker exits
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+    header_length = struct.unpack_from(header_length_format, shm.buf, 0)[0]
+    header_start = struct.calcsize(header_length_format)
+    header = json.loads(bytes(shm.buf[header_start:header_start + header_length]).decode('utf-8'))
+    return dict(shm=shm, header=header, data_start=aligned(header_start + header_length), views=[])
+
+
+def array_view(store, array_name):
+    """
+    Read-only view of an array, index it with a tuple: view[precinct, race, party]
+    """
+    if array_name not in store['header']['arrays']:
+        raise Exception(f"Array {array_name} is not in the shared store")
+    description = store['header']['arrays'][array_name]
+    start = store['data_start'] + description['offset']
+    size = struct.calcsize('q')
+    for dimension in description['shape']:
+        size *= dimension
+    view = store['shm'].buf[start:start + size].toreadonly().cast('q', shape=description['shape'])
+    store['views'].append(view)
+    return view
+
+
+def precinct_votes(store, year):
+    return array_view(store, f"precinct_votes_{year}")
+
+
+def precinct_districts(store, year):
+    return array_view(store, f"precinct_districts_{year}")
+
+
+def precinct_index(store, year):
+    """
+    Row of each precinct number in the precinct arrays of a year
+    """
+    return {precinct_number: row for row, precinct_number in enumerate(store['header']['precincts'][str(year)])}
+
+
+def district_rollup(store, year, race, district_type):
+    """
+    Returns the district numbers and the [district][party] votes view of a rollup
+    """
+    array_name = f"rollup_{year}_{race}_{district_type}"
+    return store['header']['rollup_districts'][array_name], array_view(store, array_name)
+
+
+def close_store(store):
+    for view in store['views']:
+        view.release()
+    store['views'] = []
+    store['shm'].close()
+
+
+def count_dem_seats(name):
+    """
+    Example worker: attach to the store and count the districts the Democrat carried in every rollup
+    """
+    start = time.perf_counter()
+    store = attach_store(name)
+    attach_seconds = time.perf_counter() - start
+    dem_seats = dict()
+    for array_name in store['header']['rollup_districts'].keys():
+        districts = store['header']['rollup_districts'][array_name]
+        votes = array_view(store, array_name)
+        dem_seats[array_name] = sum(1 for row in range(len(districts)) if votes[row, 0] > votes[row, 1])
+    close_store(store)
+    return attach_seconds, dem_seats
+
+
+if __name__ == "__main__":
+    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')  # For parsing numbers with comma separators
+
+    name = 'colorado_redistricting_2021'
+    workers = 8
+    years = {
+        2020: {'csvin': '2020GEPrecinctLevelResultsPosted.csv'},
+        2018: {'csvin': '2018GEPrecinctLevelResults.csv'},
+        2016: {'csvin': '2016GeneralResultsPrecinctLevel.csv'},
+        2014: {'csvin': '2014GeneralPrecinctResults.csv'},
+        2012: {'csvin': '2012GeneralPrecinctLevelResults.csv'},
+    }
+
+    precincts_by_year = dict()
+    for year in years.keys():
+        csvin = "./sos_files/{csvin}".format(csvin=years[year]['csvin'])
+        print(f"Processing {csvin}...")
+        precincts_by_year[year] = load_precinct_votes(year, csvin)
+
+    shm = publish_store(name, precincts_by_year)
+    print(f"Published {shm.size} bytes to shared memory {name}")
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            for attach_seconds, dem_seats in pool.map(count_dem_seats, [name] * workers):
+                print(f"Worker attached in {attach_seconds * 1000:.2f} ms, 2020 us_president dem seats by us_house: {dem_seats['rollup_2020_us_president_us_house']}")
+    finally:
+        shm.close()
+        shm.unlink()
@@ -5,13 +5,66 @@ There are 2 inputs:
 - The General Election Statewide Abstract results
 - The General Election Precinct Level Turnout results
 The output is placed in election_data directory.
+Next to each summary, a turnout CSV has the spread of the precinct turnout and the inactive voter share by district.
 """
 import locale
 import csv
+import math
 import re
 import pprint
 
 
+def init_sketch(bin_width=0.001):
+    """
+    Mergeable streaming quantile sketch: a sparse histogram of values rounded to bin_width (0.001 is a tenth of a percent)
+    Quantiles are within half a bin of the exact value, and sketches with the same bin_width merge by adding counts
+    """
+    return {'bin_width': bin_width, 'count': 0, 'bins': dict()}
+
+
+def sketch_add(sketch, value):
+    value_bin = round(value / sketch['bin_width'])
+    sketch['bins'][value_bin] = sketch['bins'].get(value_bin, 0) + 1
+    sketch['count'] += 1
+
+
+def sketch_merge(sketch, other):
+    if sketch['bin_width'] != other['bin_width']:
+        raise Exception(f"Cannot merge sketches with bin widths {sketch['bin_width']} and {other['bin_width']}")
+    for value_bin, count in other['bins'].items():
+        sketch['bins'][value_bin] = sketch['bins'].get(value_bin, 0) + count
+    sketch['count'] += other['count']
+
+
+def sketch_quantile(sketch, quantile):
+    if sketch['count'] == 0:
+        raise Exception("Cannot compute a quantile of an empty sketch")
+    # Nearest rank, same as the lower median for an even count
+    rank = max(1, math.ceil(quantile * sketch['count']))
+    seen = 0
+    for value_bin in sorted(sketch['bins'].keys()):
+        seen += sketch['bins'][value_bin]
+        if seen >= rank:
+            return value_bin * sketch['bin_width']
+
+
+def init_precinct_totals():
+    return dict(total_voters=0, ballots_cast=0, active_voters=0, inactive_voters=0, turnout_sketch=init_sketch())
+
+
+def merge_precinct_data(precinct_data, other):
+    """
+    Merge the district totals of 2 chunks of the same precinct file, e.g. when parsing in parallel
+    """
+    for district in other.keys():
+        if district not in precinct_data:
+            precinct_data[district] = init_precinct_totals()
+        for key in ('total_voters', 'ballots_cast', 'active_voters', 'inactive_voters'):
+            precinct_data[district][key] += other[district][key]
+        sketch_merge(precinct_data[district]['turnout_sketch'], other[district]['turnout_sketch'])
+    return precinct_data
+
+
 def process_precinct_file(csvin_precinct, district_type):
     with open(csvin_precinct, 'r') as fp1:
         precinct_data = dict()
@@ -35,7 +88,7 @@ def process_precinct_file(csvin_precinct, district_type):
                 county_number = int(matches.groups()[3])
                 county = row['County'].title()
                 if district not in precinct_data:
-                    precinct_data[district] = dict(total_voters=0, ballots_cast=0)
+                    precinct_data[district] = init_precinct_totals()
                 if county_number not in county_map:
                     county_map[county_number] = county
                 # Sanity check
@@ -44,6 +97,10 @@ def process_precinct_file(csvin_precinct, district_type):
                 # Update totals
                 precinct_data[district]['total_voters'] += locale.atoi(row['Total Voters'])
                 precinct_data[district]['ballots_cast'] += locale.atoi(row['Ballots Cast'])
+                precinct_data[district]['active_voters'] += locale.atoi(row['Active Voters'])
+                precinct_data[district]['inactive_voters'] += locale.atoi(row['Inactive Voters'])
+                # Turnout spread, example: 79.47%
+                sketch_add(precinct_data[district]['turnout_sketch'], float(row['Total Voters Turnout %'].rstrip('%')) / 100)
             else:
                 raise Exception(r"Unable to parse precinct number: {row['Precinct']}")
         # pp = pprint.PrettyPrinter()
@@ -51,6 +108,26 @@ def process_precinct_file(csvin_precinct, district_type):
         return precinct_data
 
 
+def write_turnout_file(csvout, precinct_data):
+    """
+    Write the precinct turnout spread and the inactive voter share of each district
+    """
+    quantiles = {'turnout_p10': 0.1, 'turnout_p25': 0.25, 'turnout_median': 0.5, 'turnout_p75': 0.75, 'turnout_p90': 0.9}
+    header = ['district', 'precincts', 'active_voters', 'inactive_voters', 'inactive_share'] + list(quantiles.keys())
+    with open(csvout, 'w') as fp2:
+        csvwriter = csv.DictWriter(fp2, fieldnames=header)
+        csvwriter.writeheader()
+        for district in sorted(precinct_data.keys()):
+            totals = precinct_data[district]
+            csvout_row = {'district': district, 'precincts': totals['turnout_sketch']['count'],
+                          'active_voters': totals['active_voters'], 'inactive_voters': totals['inactive_voters']}
+            registered = totals['active_voters'] + totals['inactive_voters']
+            csvout_row['inactive_share'] = round(totals['inactive_voters'] / registered, 4) if registered else 0
+            for column, quantile in quantiles.items():
+                csvout_row[column] = round(sketch_quantile(totals['turnout_sketch'], quantile), 4)
+            csvwriter.writerow(csvout_row)
+
+
 def init_row():
     return {'district': 0, 'counties': '', 'registered_voters': 0, 'ballots_cast': 0, 'democrat': 0, 'republican': 0, 'other': 0,
             'total': 0, 'dem_winner': 0, 'rep_winner': 0, 'landslide_d': 0, 'landslide_r': 0}
@@ -203,13 +280,17 @@ if __name__ == "__main__":
 
             if district_type == 'REP':
                 csvout = f"./election_data/{year}/stateRepresentatives.{year}.csv"  # REP
+                csvout_turnout = f"./election_data/{year}/stateRepresentativesTurnout.{year}.csv"
             elif district_type == 'SEN':
                 csvout = f"./election_data/{year}/stateSenate.{year}.csv"  # SEN
+                csvout_turnout = f"./election_data/{year}/stateSenateTurnout.{year}.csv"
             else:
                 raise Exception(f"Invalid district_type {district_type}")
 
             print(f"Processing {csvin_precinct}")
             precinct_data = process_precinct_file(csvin_precinct, district_type)
+            write_turnout_file(csvout_turnout, precinct_data)
+            print(f"CSV written to {csvout_turnout}")
             print(f"Processing {csvin}")
             process_election_file(csvin, csvout, precinct_data, district_type, year)
             print(f"CSV written to {csvout}")
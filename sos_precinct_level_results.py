@@ -16,6 +16,7 @@ The output is placed in election_data directory.
 
 import locale
 import csv
+import os
 import re
 import pprint
 from collections import OrderedDict
@@ -259,7 +260,16 @@ def race_matcher(year, row):
     return None
 
 
-def init_results_dict(year):
+def party_matcher(row):
+    if row['Party'] == 'Democratic Party':
+        return 'democrat'
+    elif row['Party'] == 'Republican Party':
+        return 'republican'
+    else:
+        return 'other'
+
+
+def init_results_dict(year, plans=None):
     """
     Initialize statewide races by district with dictionary of party counts by Democrat, Republican, and Other
     {
@@ -274,19 +284,25 @@ def init_results_dict(year):
         'co_county': ...
     'us_senate': ...,
     }
+    When plans are given ({plan_name: {precinct_number: district}}), the plan names replace the district types
+    and the districts are the ones used by each plan.
     """
+    if plans:
+        districts_by_type = {plan_name: tuple(sorted(set(assignment.values()))) for plan_name, assignment in plans.items()}
+    else:
+        districts_by_type = {district_type: district_types[district_type]['districts'] for district_type in district_types.keys()}
     results = dict()
     for race in statewide_races_by_year[year].keys():
         results[race] = dict()
-        for district_type in district_types.keys():
+        for district_type in districts_by_type.keys():
             district_results = OrderedDict()
-            for district in district_types[district_type]['districts']:
+            for district in districts_by_type[district_type]:
                 district_results[district] = dict(county_list=[], democrat=0, republican=0, other=0)
             results[race][district_type] = district_results
     return results
 
 
-def precinct_number_matcher(precinct_number, year, county):
+def precinct_number_matcher(precinct_number, year, county, plans=None):
     # https://www.sos.state.co.us/pubs/elections/FAQs/VoterFAQs.html
     # • First digit – Congressional District
     # • Second and third digits – State Senate District
@@ -304,9 +320,16 @@ def precinct_number_matcher(precinct_number, year, county):
             group_number = district_types[district_type]['precinct_match_group_number']
             precinct_dict[district_type] = int(matches.groups()[group_number])
         # Example: {'us_house': 1, 'co_senate': 2, 'co_house': 3, 'co_county': 4}
+        # Proposed plans are looked up by the full precinct number, see district_assignment.py
+        if plans:
+            for plan_name, assignment in plans.items():
+                if precinct_number not in assignment:
+                    raise Exception(f"Precinct {precinct_number} is not assigned to a district in plan {plan_name}!")
+                precinct_dict[plan_name] = assignment[precinct_number]
         return precinct_dict
     elif precinct_number == 'Provisional':
         # For provisional precincts, we use the County name and Year to determine the districts they voted in
+        # There is no location for these voters, so they are left out of proposed plans
         precinct_dict = dict()
         for district_type in district_types.keys():
             precinct_dict[district_type] = provisional_precincts[year][county][district_type]
@@ -319,11 +342,16 @@ def write_csv_files(year, results):
     """
     Write the results for each year and statewide office by district type
     For 2020, there are 2 statewide offices, 4 district types, for a total of 8 CSV files
+    Proposed plans are written to the plan_data directory instead
     """
     header = ('district', 'counties', 'democrat', 'republican', 'other')
     for race in results.keys():
         for district_type in results[race].keys():
-            csvout = f"./election_data/{year}/{year}_{race}_by_{district_type}.csv"
+            if district_type in district_types:
+                csvout = f"./election_data/{year}/{year}_{race}_by_{district_type}.csv"
+            else:
+                os.makedirs('./plan_data', exist_ok=True)
+                csvout = f"./plan_data/{year}_{race}_by_{district_type}.csv"
             print(f"Writing {csvout}")
             with open(csvout, 'w') as fp2:
                 csvwriter = csv.DictWriter(fp2, fieldnames=header, extrasaction='ignore')
@@ -335,8 +363,8 @@ def write_csv_files(year, results):
                     csvwriter.writerow(row)
 
 
-def process_precinct_level_results(year, csvin):
-    results = init_results_dict(year)
+def process_precinct_level_results(year, csvin, plans=None):
+    results = init_results_dict(year, plans)
     # pp = pprint.PrettyPrinter()
     # pp.pprint(results)
     with open(csvin, 'r') as fp1:
@@ -346,15 +374,13 @@ def process_precinct_level_results(year, csvin):
             race_match = race_matcher(year, row)
             if race_match:
                 # district_numbers is a dict parsed from Precinct: {'us_house': 1, 'co_senate': 2, 'co_house': 3, 'co_county': 4}
-                district_numbers = precinct_number_matcher(row['Precinct'], year, row['County'])
-                # district_type will be 'us_house', 'co_senate', 'co_house', 'co_county'
+                district_numbers = precinct_number_matcher(row['Precinct'], year, row['County'], plans)
+                # district_type will be 'us_house', 'co_senate', 'co_house', 'co_county' or a plan name
                 for district_type in results[race_match]:
-                    if row['Party'] == 'Democratic Party':
-                        party = 'democrat'
-                    elif row['Party'] == 'Republican Party':
-                        party = 'republican'
-                    else:
-                        party = 'other'
+                    if district_type not in district_numbers:
+                        # Provisional precinct in a proposed plan
+                        continue
+                    party = party_matcher(row)
                     # district_number depends on type
                     district_number = district_numbers[district_type]
                     # Update vote totals for this district
@@ -365,6 +391,39 @@ def process_precinct_level_results(year, csvin):
                         results_row['county_list'].append(row['County'])
         # After processing all rows in the precinct level CSV, output the results by district
         write_csv_files(year, results)
+    return results
+
+
+def load_precinct_votes(year, csvin):
+    """
+    Read the precinct level results without rolling them up, for editing maps precinct by precinct
+    Provisional precincts are keyed by county because they have no precinct number
+    {
+    '4253001245': {
+        'county': 'ADAMS',
+        'districts': {'us_house': 4, 'co_senate': 25, 'co_house': 30, 'co_county': 1},
+        'votes': {'us_president': {'democrat': 0, 'republican': 0, 'other': 0}, 'us_senator': ...},
+        },
+    'Provisional LARIMER': ...,
+    }
+    """
+    precincts = dict()
+    with open(csvin, 'r') as fp1:
+        csvreader = csv.DictReader(fp1)
+        for row in csvreader:
+            race_match = race_matcher(year, row)
+            if race_match:
+                precinct_number = row['Precinct']
+                if precinct_number == 'Provisional':
+                    precinct_number = f"Provisional {row['County']}"
+                if precinct_number not in precincts:
+                    precincts[precinct_number] = dict(
+                        county=row['County'],
+                        districts=precinct_number_matcher(row['Precinct'], year, row['County']),
+                        votes={race: dict(democrat=0, republican=0, other=0) for race in statewide_races_by_year[year].keys()})
+                votes = precincts[precinct_number]['votes'][race_match]
+                votes[party_matcher(row)] += locale.atoi(row[csv_column_names[year]['vote_count_column_name']])
+    return precincts
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""
+This script simulates uniform swings on the district rollups of the statewide races and answers
+"how many seats flip under a +/- N point swing".
+
+There is 1 input for each year, race and district type:
+- The {year}_{race}_by_{district_type}.csv rollup from sos_precinct_level_results.py (or a plan rollup from plan_data)
+
+Each scenario moves the same statewide swing from Republican to Democrat vote share in every district (uniform swing),
+drawn around the swing being tested, plus an independent district-level noise (noisy swing).
+The swing draws are shared by every race and binned, and the district noise is integrated exactly with the normal CDF,
+so hundreds of thousands of scenarios only cost one pass over the swing bins per race.
+
+For each swing the output has:
+- The distribution of Democratic seats
+- The flip and landslide probabilities of each district, using the same 60% landslide line as the election summaries
+- The expected number of flips and of districts crossing the landslide line
+
+The output is placed in swing_data directory.
+"""
+
+import csv
+import os
+import random
+import time
+from statistics import NormalDist
+
+from sos_precinct_level_results import statewide_races_by_year, district_types
+
+landslide_percentage = 0.6  # 60%, same as the election summaries
+
+# Ignore districts that are this close to certain when building the seat distribution
+certain_probability = 1e-12
+
+
+def load_district_rollup(csvin):
+    """
+    Read a {year}_{race}_by_{district_type}.csv rollup
+    Returns a list of dicts with the vote shares added:
+    [{'district': 1, 'counties': 'Denver', 'democrat': 0, 'republican': 0, 'other': 0, 'dem_share': 0.0, 'rep_share': 0.0}, ...]
+    """
+    districts = []
+    with open(csvin, 'r') as fp1:
+        csvreader = csv.DictReader(fp1)
+        for row in csvreader:
+            district = dict(district=int(row['district']), counties=row['counties'],
+                            democrat=int(row['democrat']), republican=int(row['republican']), other=int(row['other']))
+            total = district['democrat'] + district['republican'] + district['other']
+            if total == 0:
+                raise Exception(f"No votes in district {district['district']} of {csvin}")
+            district['dem_share'] = district['democrat'] / total
+            district['rep_share'] = district['republican'] / total
+            districts.append(district)
+    return districts
+
+
+def draw_swing_offsets(scenarios, swing_sd, seed=2021, bin_width=0.001):
+    """
+    Draw the statewide swing of every scenario around zero and bin them (0.001 is a tenth of a point)
+    Returns a list of (offset, weight) tuples, the weights add up to 1
+    The same offsets are reused for every swing and race so the results are comparable
+    """
+    rng = random.Random(seed)
+    gauss = rng.gauss
+    counts = dict()
+    for _ in range(scenarios):
+        offset_bin = round(gauss(0.0, swing_sd) / bin_width)
+        counts[offset_bin] = counts.get(offset_bin, 0) + 1
+    return [(offset_bin * bin_width, count / scenarios) for offset_bin, count in sorted(counts.items())]
+
+
+def noise_cdf(noise_sd):
+    """
+    Returns the function giving the probability that the district noise is below a value
+    """
+    if noise_sd == 0:
+        return lambda value: float(value >= 0)
+    return NormalDist(0.0, noise_sd).cdf
+
+
+def district_probabilities(district, swing, cdf):
+    """
+    Probability that the Democrat wins and that the district is a landslide after the swing
+    The swing plus noise moves vote share from Republican to Democrat, so:
+    - Democrat wins when dem_share + swing + noise > rep_share - swing - noise
+    - Democratic landslide when dem_share + swing + noise >= 60%
+    - Republican landslide when rep_share - swing - noise >= 60%
+    """
+    dem_share = district['dem_share']
+    rep_share = district['rep_share']
+    dem_win = 1.0 - cdf((rep_share - dem_share) / 2 - swing)
+    landslide_d = 1.0 - cdf(landslide_percentage - dem_share - swing)
+    landslide_r = cdf(rep_share - landslide_percentage - swing)
+    return dem_win, landslide_d + landslide_r
+
+
+def seat_distribution(dem_win_probabilities):
+    """
+    Distribution of the number of Democratic seats when every district is won independently
+    Returns a list where index N is the probability of N Democratic seats
+    """
+    certain_seats = 0
+    distribution = [1.0]
+    for probability in dem_win_probabilities:
+        if probability >= 1.0 - certain_probability:
+            certain_seats += 1
+        elif probability > certain_probability:
+            new_distribution = [0.0] * (len(distribution) + 1)
+            for seats, seats_probability in enumerate(distribution):
+                new_distribution[seats] += seats_probability * (1.0 - probability)
+                new_distribution[seats + 1] += seats_probability * probability
+            distribution = new_distribution
+    return [0.0] * certain_seats + distribution + [0.0] * (len(dem_win_probabilities) - certain_seats - len(distribution) + 1)
+
+
+def simulate_swing(districts, swing, swing_offsets, noise_sd):
+    """
+    Simulate the scenarios drawn around one swing
+    {
+    'swing': 0.02,
+    'seats': [0.0, ...],  # probability of 0, 1, 2, ... Democratic seats
+    'expected_dem_seats': ...,
+    'expected_flips': ...,
+    'expected_landslide_crossings': ...,
+    'districts': [{'district': 1, 'flip_probability': ..., 'landslide_probability': ..., 'landslide_crossing_probability': ...}, ...],
+    }
+    """
+    cdf = noise_cdf(noise_sd)
+    seats = [0.0] * (len(districts) + 1)
+    dem_win_totals = [0.0] * len(districts)
+    landslide_totals = [0.0] * len(districts)
+    for offset, weight in swing_offsets:
+        dem_win_probabilities = []
+        for i, district in enumerate(districts):
+            dem_win, landslide = district_probabilities(district, swing + offset, cdf)
+            dem_win_probabilities.append(dem_win)
+            dem_win_totals[i] += dem_win * weight
+            landslide_totals[i] += landslide * weight
+        for dem_seats, probability in enumerate(seat_distribution(dem_win_probabilities)):
+            seats[dem_seats] += probability * weight
+
+    results = dict(swing=swing, seats=seats, expected_dem_seats=sum(n * p for n, p in enumerate(seats)),
+                   expected_flips=0.0, expected_landslide_crossings=0.0, districts=[])
+    for i, district in enumerate(districts):
+        # Compare with who won and which districts were landslides without any swing
+        if district['democrat'] > district['republican']:
+            flip_probability = 1.0 - dem_win_totals[i]
+        else:
+            flip_probability = dem_win_totals[i]
+        if max(district['dem_share'], district['rep_share']) >= landslide_percentage:
+            landslide_crossing_probability = 1.0 - landslide_totals[i]
+        else:
+            landslide_crossing_probability = landslide_totals[i]
+        results['expected_flips'] += flip_probability
+        results['expected_landslide_crossings'] += landslide_crossing_probability
+        results['districts'].append(dict(district=district['district'], counties=district['counties'],
+                                         dem_share=district['dem_share'], rep_share=district['rep_share'],
+                                         flip_probability=flip_probability, landslide_probability=landslide_totals[i],
+                                         landslide_crossing_probability=landslide_crossing_probability))
+    return results
+
+
+def write_csv_files(csvout_prefix, sweep):
+    """
+    Write the summary, seat distribution and district probabilities of a sweep of swings
+    """
+    csvout = f"{csvout_prefix}_swing_summary.csv"
+    print(f"Writing {csvout}")
+    with open(csvout, 'w') as fp2:
+        header = ('swing', 'expected_dem_seats', 'expected_flips', 'expected_landslide_crossings')
+        csvwriter = csv.DictWriter(fp2, fieldnames=header, extrasaction='ignore')
+        csvwriter.writeheader()
+        csvwriter.writerows(sweep)
+
+    csvout = f"{csvout_prefix}_swing_seats.csv"
+    print(f"Writing {csvout}")
+    with open(csvout, 'w') as fp2:
+        csvwriter = csv.writer(fp2)
+        csvwriter.writerow(('swing', 'dem_seats', 'probability'))
+        for results in sweep:
+            for dem_seats, probability in enumerate(results['seats']):
+                csvwriter.writerow((results['swing'], dem_seats, probability))
+
+    csvout = f"{csvout_prefix}_swing_districts.csv"
+    print(f"Writing {csvout}")
+    with open(csvout, 'w') as fp2:
+        header = ('swing', 'district', 'counties', 'dem_share', 'rep_share',
+                  'flip_probability', 'landslide_probability', 'landslide_crossing_probability')
+        csvwriter = csv.DictWriter(fp2, fieldnames=header)
+        csvwriter.writeheader()
+        for results in sweep:
+            for row in results['districts']:
+                row['swing'] = results['swing']
+                csvwriter.writerow(row)
+
+
+if __name__ == "__main__":
+    scenarios = 200000
+    swing_sd = 0.02  # Uncertainty of the statewide swing, 2 points
+    noise_sd = 0.03  # District-level deviation from the uniform swing, 3 points
+    swings = [points / 100 for points in range(-5, 6)]  # -5 to +5 points, positive is toward the Democrat
+
+    start = time.perf_counter()
+    swing_offsets = draw_swing_offsets(scenarios, swing_sd)
+    print(f"Drew {scenarios} swings into {len(swing_offsets)} bins in {time.perf_counter() - start:.3f} seconds")
+
+    for year in statewide_races_by_year.keys():
+        os.makedirs(f"./swing_data/{year}", exist_ok=True)
+        for race in statewide_races_by_year[year].keys():
+            for district_type in district_types.keys():
+                csvin = f"./election_data/{year}/{year}_{race}_by_{district_type}.csv"
+                print(f"Processing {csvin}")
+                start = time.perf_counter()
+                districts = load_district_rollup(csvin)
+                sweep = [simulate_swing(districts, swing, swing_offsets, noise_sd) for swing in swings]
+                print(f"Simulated {len(swings)} swings in {time.perf_counter() - start:.3f} seconds")
+                write_csv_files(f"./swing_data/{year}/{year}_{race}_by_{district_type}", sweep)